@@ -4,95 +4,336 @@ NVIDIA NIM ACP Client
 Implements the Agent Client Protocol (ACP) for Toad integration.
 """
 
+from __future__ import annotations
+
+import asyncio
+import functools
+import importlib.util
 import json
 import os
+import random
+import stat
 import sys
+import traceback
+from collections.abc import AsyncIterator
+from typing import TYPE_CHECKING, Any, Protocol
+
+# httpx is imported where it is first needed: it is the bulk of this
+# module's import time, and the launcher imports the package before it has
+# validated its arguments.
+if TYPE_CHECKING:
+    import httpx
+
+try:
+    import orjson
+
+    _dumps = orjson.dumps
+    _loads = orjson.loads
+except ImportError:  # orjson is optional, see the "speedups" extra
+    # json.dumps() builds a new encoder per call when given options; reuse one.
+    _encode = json.JSONEncoder(separators=(",", ":"), ensure_ascii=False).encode
+
+    def _dumps(obj: Any) -> bytes:
+        return _encode(obj).encode()
+
+    _loads = json.loads
 
 BASE_URL = "https://integrate.api.nvidia.com/v1"
 DEFAULT_MODEL = "deepseek-ai/deepseek-v3.2"
 
 SESSION_ID = "session-1"
 
+# Longest request line accepted on stdin (prompts can carry large files).
+MAX_FRAME_BYTES = 16 * 1024 * 1024
+
+# Transient statuses worth retrying, and how many attempts to make in total.
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+MAX_ATTEMPTS = 5
+
+
+def _max_inflight(default: int = 8) -> int:
+    """Read NVIDIA_MAX_INFLIGHT, falling back to default when it is not a number."""
+    try:
+        value = int(os.environ.get("NVIDIA_MAX_INFLIGHT", default))
+    except ValueError:
+        return default
+    return max(1, value)
+
+
+# Cap on concurrent requests to the NVIDIA API, to stay within rate limits.
+MAX_INFLIGHT = _max_inflight()
+
+# HTTP/2 needs the h2 package (the httpx[http2] extra); use HTTP/1.1 without it.
+_HTTP2 = importlib.util.find_spec("h2") is not None
+
+_CLIENT: httpx.AsyncClient | None = None
+_WRITER: _Writer | None = None
+# Holds a strong reference to the stdin feeder task so it isn't collected.
+_STDIN_FEEDER: asyncio.Task | None = None
+# Frames queued by the send_* helpers until the next _flush().
+_PENDING = bytearray()
 
+
+# The environment doesn't change under us, so read each variable only once. The
+# lookup is deferred to the first call so the launcher can set NVIDIA_MODEL.
+@functools.cache
 def get_model() -> str:
     """Get model from environment variable or use default."""
     return os.environ.get("NVIDIA_MODEL", DEFAULT_MODEL)
 
 
+@functools.cache
 def get_api_key() -> str:
     """Get API key from environment variable."""
     return os.environ.get("NVIDIA_API_KEY", "")
 
 
+def _write(data: bytes) -> None:
+    """Queue one encoded frame for the next flush."""
+    _PENDING.extend(data)
+
+
+async def _flush() -> None:
+    """Write all queued frames to stdout in a single call."""
+    if _PENDING:
+        data = bytes(_PENDING)
+        _PENDING.clear()
+        _WRITER.write(data)
+    # Only blocks when the pipe's buffer is above the high-water mark.
+    await _WRITER.drain()
+
+
+# Only the update (or result) varies between frames, so splice it into
+# pre-encoded scaffolding instead of wrapping it in fresh dicts.
+_NOTIFICATION_PREFIX = (
+    b'{"jsonrpc":"2.0","method":"session/update","params":{"sessionId":'
+    + _dumps(SESSION_ID)
+    + b',"update":{"sessionUpdate":'
+)
+_RESPONSE_TEMPLATE = b'{"id":%s,"result":%s}\n'
+
+
+@functools.cache
+def _notification_prefix(update_type: str) -> bytes:
+    """Frame bytes up to and including the update's sessionUpdate field."""
+    return _NOTIFICATION_PREFIX + _dumps(update_type)
+
+
 def send_notification(update_type: str, content: dict) -> None:
     """Send session/update notification."""
-    notification = {
-        "jsonrpc": "2.0",
-        "method": "session/update",
-        "params": {
-            "sessionId": SESSION_ID,
-            "update": {
-                "sessionUpdate": update_type,
-                **content,
-            },
-        },
-    }
-    sys.stdout.write(json.dumps(notification) + "\n")
-    sys.stdout.flush()
+    # Encode content on its own and reuse its closing brace for the update
+    # object, rather than copying it into a new dict with sessionUpdate.
+    body = b"," + _dumps(content)[1:] if content else b"}"
+    _write(_notification_prefix(update_type) + body + b"}}\n")
 
 
 def send_response(request_id: int | str | None, result: dict) -> None:
     """Send JSON response to stdout."""
-    sys.stdout.write(json.dumps({"id": request_id, "result": result}) + "\n")
-    sys.stdout.flush()
+    _write(_RESPONSE_TEMPLATE % (_dumps(request_id), _dumps(result)))
+
+
+_ERROR_TEMPLATE = b'{"id":%s,"error":{"code":-32000,"message":%s}}\n'
 
 
 def send_error(request_id: int | str | None, message: str) -> None:
     """Send error response."""
-    sys.stdout.write(
-        json.dumps({"id": request_id, "error": {"code": -32000, "message": message}})
-        + "\n"
-    )
-    sys.stdout.flush()
+    _write(_ERROR_TEMPLATE % (_dumps(request_id), _dumps(message)))
+
+
+_INIT_RESULT = {
+    "protocolVersion": 1,
+    "capabilities": {
+        "prompts": {"listChanged": False},
+        "resources": {"listChanged": False, "subscribe": False},
+        "tools": {"listChanged": False},
+        "env": True,
+        "status": {"reporting": "full"},
+        "sessions": True,
+        "notifications": {
+            "taskStarted": True,
+            "taskCompleted": True,
+            "taskError": True,
+            "console": True,
+        },
+    },
+    "serverInfo": {"name": "nvidia-nim-acp", "version": "0.1.0"},
+}
+
+# The initialize response only differs by id, so encode the rest once.
+# _INIT_RESULT is only read here; changing it later has no effect.
+_INIT_PREFIX = b'{"id":'
+_INIT_SUFFIX = b',"result":' + _dumps(_INIT_RESULT) + b"}\n"
 
 
-def handle_initialize(request_id) -> None:
+async def handle_initialize(request_id, params) -> None:
     """Handle initialize request."""
-    send_response(
-        request_id,
-        {
-            "protocolVersion": 1,
-            "capabilities": {
-                "prompts": {"listChanged": False},
-                "resources": {"listChanged": False, "subscribe": False},
-                "tools": {"listChanged": False},
-                "env": True,
-                "status": {"reporting": "full"},
-                "sessions": True,
-                "notifications": {
-                    "taskStarted": True,
-                    "taskCompleted": True,
-                    "taskError": True,
-                    "console": True,
-                },
-            },
-            "serverInfo": {"name": "nvidia-nim-acp", "version": "0.1.0"},
-        },
-    )
+    _write(_INIT_PREFIX + _dumps(request_id) + _INIT_SUFFIX)
 
 
-def handle_session_new(request_id) -> None:
+async def handle_session_new(request_id, params) -> None:
     """Handle session/new request."""
     send_response(request_id, {"sessionId": SESSION_ID})
 
 
-def handle_session_prompt(request_id, params) -> None:
+def _get_client(api_key: str) -> httpx.AsyncClient:
+    """Return the shared HTTP client, creating it on first use.
+
+    Reusing one client keeps the connection pool (and TLS session) to the
+    NVIDIA API alive across prompts. The API key is read once per process, so
+    the auth header is set when the client is created.
+    """
+    global _CLIENT
+    if _CLIENT is None:
+        import httpx
+
+        _CLIENT = httpx.AsyncClient(
+            http2=_HTTP2,
+            timeout=httpx.Timeout(300.0, connect=10.0, pool=60.0),
+            # _INFLIGHT already caps concurrent requests, so size the pool
+            # to match rather than holding idle sockets open.
+            limits=httpx.Limits(
+                max_connections=MAX_INFLIGHT,
+                max_keepalive_connections=MAX_INFLIGHT,
+                keepalive_expiry=75.0,
+            ),
+            headers={
+                "Authorization": f"Bearer {api_key}",
+                "Content-Type": "application/json",
+            },
+        )
+    return _CLIENT
+
+
+async def _close_client() -> None:
+    """Close the shared HTTP client, if one was created."""
+    global _CLIENT
+    if _CLIENT is not None:
+        await _CLIENT.aclose()
+        _CLIENT = None
+
+
+class _AdaptiveLimit:
+    """Concurrency limit for API requests that adapts to server feedback.
+
+    Additive-increase/multiplicative-decrease: every healthy response raises
+    the limit by half a slot (up to ``maximum``), while a 429, a 5xx or an
+    exhausted rate-limit header halves it (down to one request at a time).
+    """
+
+    def __init__(self, maximum: int) -> None:
+        self.maximum = maximum
+        self.limit = float(maximum)
+        self._active = 0
+        self._changed = asyncio.Condition()
+
+    async def __aenter__(self) -> None:
+        async with self._changed:
+            await self._changed.wait_for(lambda: self._active < int(self.limit))
+            self._active += 1
+
+    async def __aexit__(self, *exc_info) -> None:
+        async with self._changed:
+            self._active -= 1
+            self._changed.notify_all()
+
+    def record(self, response: httpx.Response) -> None:
+        """Adjust the limit after a response from the API."""
+        remaining = response.headers.get("x-ratelimit-remaining-requests")
+        if response.status_code in RETRY_STATUSES or remaining == "0":
+            self.limit = max(1.0, self.limit / 2)
+        else:
+            self.limit = min(float(self.maximum), self.limit + 0.5)
+
+
+_INFLIGHT = _AdaptiveLimit(MAX_INFLIGHT)
+
+
+def _retry_delay(response: httpx.Response, attempt: int) -> float:
+    """Seconds to wait before retrying, honoring Retry-After when given."""
+    try:
+        delay = float(response.headers.get("Retry-After", 2**attempt))
+    except ValueError:  # HTTP-date form
+        delay = 2**attempt
+    return min(delay + random.random() * 0.25, 30.0)
+
+
+async def _send(
+    client: httpx.AsyncClient, request: httpx.Request, stream: bool = False
+) -> httpx.Response:
+    """Send a request, retrying rate-limited and 5xx responses with backoff."""
+    for attempt in range(1, MAX_ATTEMPTS + 1):
+        response = await client.send(request, stream=stream)
+        _INFLIGHT.record(response)
+        if response.status_code not in RETRY_STATUSES or attempt == MAX_ATTEMPTS:
+            break
+        await response.aclose()
+        await asyncio.sleep(_retry_delay(response, attempt))
+    return response
+
+
+async def _sse_data(response: httpx.Response) -> AsyncIterator[bytes]:
+    """Yield the payload of each server-sent event "data:" line.
+
+    Lines are split from the raw body so payloads reach the JSON parser as
+    bytes, without a round trip through str. SSE allows "\n", "\r\n" or a
+    bare "\r" to end a line, which is what bytes.splitlines() splits on.
+    """
+    pending = b""
+    async for chunk in response.aiter_bytes():
+        lines = (pending + chunk).splitlines(keepends=True)
+        # Hold back a trailing partial line until the rest of it arrives.
+        pending = b""
+        if lines and lines[-1][-1:] not in (b"\n", b"\r"):
+            pending = lines.pop()
+        for line in lines:
+            # The space after the colon is optional.
+            if line.startswith(b"data:"):
+                yield line[5:].strip()
+    if pending.startswith(b"data:"):
+        yield pending[5:].strip()
+
+
+async def stream_chat_complete(
+    api_key: str, messages: list[dict[str, str]], model: str
+) -> AsyncIterator[dict[str, Any]]:
+    """Stream NVIDIA NIM chat completion choices as they arrive."""
+    client = _get_client(api_key)
+    payload = {
+        "model": model,
+        "messages": messages,
+        "max_tokens": 32768,
+        "temperature": 1.0,
+        "stream": True,
+    }
+    # Encode the body once; _send() reuses the same request if it retries.
+    request = client.build_request(
+        "POST", f"{BASE_URL}/chat/completions", content=_dumps(payload)
+    )
+    async with _INFLIGHT:
+        response = await _send(client, request, stream=True)
+        try:
+            if response.is_error:
+                # Load the body so the error message can include it.
+                await response.aread()
+            response.raise_for_status()
+            async for data in _sse_data(response):
+                if data == b"[DONE]":
+                    break
+                chunk = _loads(data)
+                if chunk.get("choices"):
+                    yield chunk["choices"][0]
+        finally:
+            await response.aclose()
+
+
+async def handle_session_prompt(request_id, params) -> None:
     """Handle session/prompt request."""
     content_blocks = params.get("prompt", [])
-    messages = []
-    for block in content_blocks:
-        if block.get("type") == "text":
-            messages.append({"role": "user", "content": block.get("text", "")})
+    messages = [
+        {"role": "user", "content": block.get("text", "")}
+        for block in content_blocks
+        if block.get("type") == "text"
+    ]
 
     if not messages:
         send_response(request_id, {"stopReason": "end_turn"})
@@ -105,43 +346,33 @@ def handle_session_prompt(request_id, params) -> None:
 
     model_id = get_model()
 
-    try:
-        import httpx
-
-        headers = {
-            "Authorization": f"Bearer {api_key}",
-            "Content-Type": "application/json",
-        }
-        payload = {
-            "model": model_id,
-            "messages": messages,
-            "max_tokens": 32768,
-            "temperature": 1.0,
-            "stream": False,
-        }
-        with httpx.Client(timeout=300.0) as client:
-            response = client.post(
-                f"{BASE_URL}/chat/completions", headers=headers, json=payload
-            )
-            response.raise_for_status()
-            data = response.json()
-
-            choice = data["choices"][0]
-            content = choice["message"]["content"]
-
-            # Send content via notification
-            send_notification(
-                "agent_message_chunk", {"content": {"type": "text", "text": content}}
-            )
+    import httpx
 
-            # Send completion response
-            stop_reason = choice.get("finish_reason", "end_turn")
-            if stop_reason == "length":
-                stop_reason = "max_tokens"
-            else:
-                stop_reason = "end_turn"
+    try:
+        finish_reason = None
+        async for choice in stream_chat_complete(api_key, messages, model_id):
+            delta = choice.get("delta") or {}
+            finish_reason = choice.get("finish_reason") or finish_reason
+
+            # Forward each delta as soon as it arrives
+            if thought := delta.get("reasoning_content") or delta.get("reasoning"):
+                send_notification(
+                    "agent_thought_chunk",
+                    {"content": {"type": "text", "text": thought}},
+                )
+            if text := delta.get("content"):
+                send_notification(
+                    "agent_message_chunk", {"content": {"type": "text", "text": text}}
+                )
+            await _flush()
+
+        # Send completion response
+        if finish_reason == "length":
+            stop_reason = "max_tokens"
+        else:
+            stop_reason = "end_turn"
 
-            send_response(request_id, {"stopReason": stop_reason})
+        send_response(request_id, {"stopReason": stop_reason})
 
     except httpx.HTTPStatusError as e:
         send_error(
@@ -151,41 +382,208 @@ def handle_session_prompt(request_id, params) -> None:
         send_error(request_id, str(e))
 
 
-def handle_session_end(request_id) -> None:
+async def handle_session_end(request_id, params) -> None:
     """Handle session/end request."""
     send_response(request_id, {})
 
 
-def main():
+async def handle_session_update(request_id, params) -> None:
+    """Handle session/update notifications from the client by ignoring them."""
+
+
+HANDLERS = {
+    "initialize": handle_initialize,
+    "session/new": handle_session_new,
+    "session/prompt": handle_session_prompt,
+    "session/end": handle_session_end,
+    "session/update": handle_session_update,
+}
+
+
+class _Writer(Protocol):
+    """The part of StreamWriter used for stdout."""
+
+    def write(self, data: bytes) -> None: ...
+
+    async def drain(self) -> None: ...
+
+    def close(self) -> None: ...
+
+
+class _FileWriter:
+    """Blocking stand-in for a StreamWriter when stdout is a regular file."""
+
+    def __init__(self, file) -> None:
+        self._file = file
+
+    def write(self, data: bytes) -> None:
+        self._file.write(data)
+
+    async def drain(self) -> None:
+        self._file.flush()
+
+    def close(self) -> None:
+        self._file.flush()
+
+
+def _is_regular_file(file) -> bool:
+    """Whether file is backed by a regular file rather than a pipe or tty."""
+    return stat.S_ISREG(os.fstat(file.fileno()).st_mode)
+
+
+async def _feed(reader: asyncio.StreamReader, file) -> None:
+    """Copy a regular file into reader from a worker thread."""
+    while data := await asyncio.to_thread(file.read1, 256 * 1024):
+        reader.feed_data(data)
+    reader.feed_eof()
+
+
+async def open_stdio() -> tuple[asyncio.StreamReader, _Writer]:
+    """Connect stdin/stdout to asyncio streams so I/O doesn't block the loop.
+
+    Pipes, sockets and terminals are watched by the event loop itself. The
+    loop can't poll regular files (e.g. ``nvidia-nim-acp < frames.jsonl``),
+    so those fall back to a reader thread and plain buffered writes.
+    """
+    global _STDIN_FEEDER
+    loop = asyncio.get_running_loop()
+    reader = asyncio.StreamReader(limit=MAX_FRAME_BYTES)
+    # Check up front: stock asyncio raises ValueError for regular files, but
+    # uvloop aborts the process instead, so the error can't be caught.
+    if _is_regular_file(sys.stdin):
+        _STDIN_FEEDER = asyncio.create_task(_feed(reader, sys.stdin.buffer))
+    else:
+        await loop.connect_read_pipe(
+            lambda: asyncio.StreamReaderProtocol(reader), sys.stdin
+        )
+    if _is_regular_file(sys.stdout):
+        writer = _FileWriter(sys.stdout.buffer)
+    else:
+        transport, protocol = await loop.connect_write_pipe(
+            asyncio.streams.FlowControlMixin, sys.stdout
+        )
+        writer = asyncio.StreamWriter(transport, protocol, None, loop)
+    return reader, writer
+
+
+async def serve() -> None:
     """Main ACP client loop."""
-    while True:
-        line = sys.stdin.readline()
-        if not line:
-            break
+    global _WRITER
+    reader, _WRITER = await open_stdio()
+    try:
+        await _serve(reader)
+    finally:
+        await _close_client()
+        await _flush()
+        _WRITER.close()
+
+
+async def _run(handler, request_id, params) -> None:
+    """Run one handler and flush whatever it queued."""
+    await handler(request_id, params)
+    await _flush()
+
 
+async def _run_prompt(handler, request_id, params) -> None:
+    """Run a prompt task, replying with an error if it fails unexpectedly.
+
+    Nothing awaits these tasks' results, so an exception that escaped here
+    would leave the request unanswered and only surface at garbage collection.
+    """
+    try:
+        await _run(handler, request_id, params)
+    except Exception as e:
+        traceback.print_exc()
+        send_error(request_id, str(e))
+        await _flush()
+
+
+async def _skip_line(reader: asyncio.StreamReader, consumed: int) -> None:
+    """Discard the rest of a line longer than MAX_FRAME_BYTES.
+
+    readline() would only drop what is buffered so far, and the remainder of
+    the line would then be read back as further frames.
+    """
+    while True:
+        await reader.readexactly(consumed)
         try:
-            request = json.loads(line)
-        except json.JSONDecodeError:
-            continue
-
-        request_id = request.get("id")
-        method = request.get("method")
-        params = request.get("params", {})
-
-        if method == "initialize":
-            handle_initialize(request_id)
-        elif method == "session/new":
-            handle_session_new(request_id)
-        elif method == "session/prompt":
-            handle_session_prompt(request_id, params)
-        elif method == "session/end":
-            handle_session_end(request_id)
-            break
-        elif method == "session/update":
-            # Notifications from client - acknowledge and ignore
-            pass
-        else:
-            send_error(request_id, f"Method not found: {method}")
+            await reader.readuntil(b"\n")
+            return
+        except asyncio.LimitOverrunError as e:
+            consumed = e.consumed
+        except asyncio.IncompleteReadError:
+            return
+
+
+async def _serve(reader: asyncio.StreamReader) -> None:
+    """Read and answer requests from stdin until it closes."""
+    # Prompts run as background tasks so a slow completion doesn't stop
+    # stdin from being read; at most MAX_INFLIGHT are outstanding at once.
+    prompts: set[asyncio.Task] = set()
+    try:
+        while True:
+            try:
+                line = await reader.readuntil(b"\n")
+            except asyncio.IncompleteReadError as e:
+                # EOF: a final frame without a newline, or nothing at all.
+                line = e.partial
+            except asyncio.LimitOverrunError as e:
+                await _skip_line(reader, e.consumed)
+                send_error(None, "Frame too large")
+                await _flush()
+                continue
+            if not line:
+                break
+
+            # Cheap check before handing the line to the JSON parser. The
+            # parser skips surrounding whitespace itself, so only copy via
+            # lstrip() in the rare case the frame doesn't start with "{".
+            if line[:1] != b"{" and line.lstrip()[:1] != b"{":
+                continue
+
+            try:
+                request = _loads(line)
+            except json.JSONDecodeError:
+                continue
+
+            request_id = request.get("id")
+            method = request.get("method")
+            params = request.get("params", {})
+
+            handler = HANDLERS.get(method)
+            if handler is None:
+                if "id" in request:
+                    # Notifications (no id) for unknown methods get no reply.
+                    send_error(request_id, f"Method not found: {method}")
+                    await _flush()
+            elif method == "session/prompt":
+                if len(prompts) >= MAX_INFLIGHT:
+                    await asyncio.wait(prompts, return_when=asyncio.FIRST_COMPLETED)
+                task = asyncio.create_task(_run_prompt(handler, request_id, params))
+                prompts.add(task)
+                task.add_done_callback(prompts.discard)
+            elif method == "session/end":
+                # Let outstanding prompts answer before the session closes.
+                if prompts:
+                    await asyncio.gather(*prompts, return_exceptions=True)
+                await _run(handler, request_id, params)
+                break
+            else:
+                await _run(handler, request_id, params)
+    finally:
+        if prompts:
+            await asyncio.gather(*prompts, return_exceptions=True)
+
+
+def main():
+    """Run the ACP client on uvloop when it is installed, else asyncio."""
+    try:
+        import uvloop
+    except ImportError:
+        run = asyncio.run
+    else:
+        run = uvloop.run
+    run(serve())
 
 
 if __name__ == "__main__":
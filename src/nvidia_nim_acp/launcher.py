@@ -8,32 +8,40 @@ Models: kimi, kimi-thinking, deepseek, r1, coder, qwen
 
 import os
 import sys
+from types import MappingProxyType
 
-MODEL_MAP = {
-    "kimi": "moonshotai/kimi-k2.5",
-    "kimi-thinking": "moonshotai/kimi-k2-thinking",
-    "deepseek": "deepseek-ai/deepseek-v3.2",
-    "glm": "z-ai/glm4.7",
-    "r1": "deepseek-ai/deepseek-r1-distill-qwen-32b",
-    "coder": "deepseek-ai/deepseek-coder-6.7b-instruct",
-    "qwen": "qwen/qwen2.5-coder-32b-instruct",
-}
+MODEL_MAP = MappingProxyType(
+    {
+        "kimi": "moonshotai/kimi-k2.5",
+        "kimi-thinking": "moonshotai/kimi-k2-thinking",
+        "deepseek": "deepseek-ai/deepseek-v3.2",
+        "glm": "z-ai/glm4.7",
+        "r1": "deepseek-ai/deepseek-r1-distill-qwen-32b",
+        "coder": "deepseek-ai/deepseek-coder-6.7b-instruct",
+        "qwen": "qwen/qwen2.5-coder-32b-instruct",
+    }
+)
+
+MODEL_NAMES = ", ".join(MODEL_MAP)
 
 
 def main():
     if len(sys.argv) < 2:
         print("Usage: nvidia-nim-launcher <model-name>")
-        print(f"Available models: {', '.join(MODEL_MAP.keys())}")
+        print(f"Available models: {MODEL_NAMES}")
         sys.exit(1)
 
-    model_name = sys.argv[1].lower()
-    if model_name not in MODEL_MAP:
-        print(f"Unknown model: {model_name}")
-        print(f"Available models: {', '.join(MODEL_MAP.keys())}")
+    # Keys are lowercase, so only lowercase the argument if it doesn't match.
+    model_name = sys.argv[1]
+    model = MODEL_MAP.get(model_name) or MODEL_MAP.get(model_name.lower())
+    if model is None:
+        print(f"Unknown model: {model_name.lower()}")
+        print(f"Available models: {MODEL_NAMES}")
         sys.exit(1)
 
-    os.environ["NVIDIA_MODEL"] = MODEL_MAP[model_name]
-    print(f"Launching with {MODEL_MAP[model_name]}")
+    os.environ["NVIDIA_MODEL"] = model
+    # stdout carries the JSON-RPC stream, so keep diagnostics on stderr.
+    print(f"Launching with {model}", file=sys.stderr)
 
     from nvidia_nim_acp import main as acp_main
 